@@ -5,6 +5,11 @@ import importlib.util
 from pathlib import Path
 
 def load_module(module_name, module_path):
+    # Reuse the module if it has already been imported or loaded
+    module = sys.modules.get(module_name)
+    if module is not None:
+        return module
+    
     try:
         spec = importlib.util.spec_from_file_location(module_name, module_path)
         if spec is None:
@@ -30,9 +35,9 @@ def run_module(module, module_name):
     try:
         # Check if the module has a main function
         if hasattr(module, 'main') and callable(module.main):
-            start_time = time.time()
+            start_time = time.monotonic()
             result = module.main()
-            elapsed_time = time.time() - start_time
+            elapsed_time = time.monotonic() - start_time
             
             print(f"\n{'-'*60}")
             print(f"{module_name.upper()} COMPLETED in {elapsed_time:.2f} seconds")
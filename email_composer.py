@@ -1,78 +1,62 @@
+import asyncio
 import csv
+import email.utils
+import hashlib
 import json
-import requests
+import aiohttp
+import math
 import os
+import re
+import string
 import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
 from pathlib import Path
-from datetime import datetime, timedelta
 from dotenv import load_dotenv
 
+try:
+    import orjson
+except ImportError:  # Fall back to the standard library json module
+    orjson = None
+
 load_dotenv()
 
-class TokenRateLimiter:
-    """Manages API rate limiting based on token usage"""
-    def __init__(self, tokens_per_minute=6000):
-        self.tokens_per_minute = tokens_per_minute
-        self.used_tokens = 0
-        self.window_start = datetime.now()
-    
-    def request_permission(self, estimated_tokens=1500):
-        """
-        Check if a request with estimated token usage can be made
-        Returns: seconds to wait (0 if no wait needed)
-        """
-        now = datetime.now()
-        
-        # Reset counter if a minute has passed
-        if now - self.window_start > timedelta(minutes=1):
-            self.used_tokens = 0
-            self.window_start = now
-            return 0
-        
-        # Calculate remaining tokens in current window
-        remaining_tokens = self.tokens_per_minute - self.used_tokens
-        
-        # If we have enough tokens, grant permission immediately
-        if remaining_tokens >= estimated_tokens:
-            return 0
-        
-        # Calculate time until next window
-        seconds_until_reset = 60 - (now - self.window_start).seconds
-        return seconds_until_reset
-    
-    def record_usage(self, tokens_used):
-        """Record actual token usage after making a request"""
-        self.used_tokens += tokens_used
-
-def read_leads_from_csv(file_path):
-    """Read lead data from CSV file"""
-    leads = []
-    with open(file_path, mode='r', encoding='utf-8') as file:
-        reader = csv.DictReader(file)
-        for row in reader:
-            leads.append(row)
-    return leads
-
-def generate_email_with_groq(lead, rate_limiter):
-    # API configuration
-    url = "https://api.groq.com/openai/v1/chat/completions"
-    headers = {
-        "Authorization": f"Bearer {os.getenv('GROQ_API_KEY')}",
-        "Content-Type": "application/json"
-    }
-    
-    # Construct the prompt with lead data - now in German
-    prompt = f"""Generiere eine direkte, professionelle Kalt-E-Mail auf Deutsch für {lead.get('name', '')}.
+# Configuration from environment variables, read once at import
+GROQ_API_URL = "https://api.groq.com/openai/v1/chat/completions"
+GROQ_HEADERS = {
+    "Authorization": f"Bearer {os.getenv('GROQ_API_KEY')}",
+    "Content-Type": "application/json"
+}
+EMAIL_FROM = os.getenv('EMAIL_FROM', 'MS_GmoyJz@trial-o65qngken68gwr12.mlsender.net')
+
+# File paths
+LEADS_CSV_PATH = Path(os.getenv('LEADS_CSV_PATH', 'venv/data/leads.csv'))
+OUTPUT_DIR = Path(os.getenv('OUTPUT_DIR', 'venv/data/emails'))
+JSON_OUTPUT_PATH = Path(os.getenv('JSON_OUTPUT_PATH', 'venv/data/outreach_emails.json'))
+JSONL_OUTPUT_PATH = JSON_OUTPUT_PATH.with_suffix('.jsonl')
+
+# Namespace for the idempotency keys derived from each prompt
+IDEMPOTENCY_NAMESPACE = uuid.uuid5(uuid.NAMESPACE_URL, GROQ_API_URL)
+
+# Throughput settings
+TOKENS_PER_MINUTE = int(os.getenv('TOKENS_PER_MINUTE', 6000))
+MAX_CONCURRENT_REQUESTS = int(os.getenv('MAX_CONCURRENT_REQUESTS', 8))  # Groq requests in flight at once
+JSON_BATCH_SIZE = int(os.getenv('JSON_BATCH_SIZE', 50))  # Email records buffered before writing to disk
+MAX_RETRY_AFTER_WAIT = 60  # Longest Retry-After wait in seconds before giving up on a lead
+
+# Prompt for the cold email, filled in per lead with PROMPT_TEMPLATE.format_map
+PROMPT_TEMPLATE = """Generiere eine direkte, professionelle Kalt-E-Mail auf Deutsch für {name}.
 
 Geschäftsdetails:
-- Firmenname: {lead.get('name', '')}
-- Name des Inhabers: {lead.get('owner_name', '')}
-- Adresse: {lead.get('full_address', '')}
-- Geschäftstyp: {lead.get('type', '')}
-- Bewertung: {lead.get('rating', '')} von 5 Sternen aus {lead.get('review_count', '')} Bewertungen
-- Verifizierungsstatus: {lead.get('verified', '')}
-- Status: {lead.get('business_status', '')}
-- Zusätzliche Informationen: {lead.get('about', '')}
+- Firmenname: {name}
+- Name des Inhabers: {owner_name}
+- Adresse: {full_address}
+- Geschäftstyp: {type}
+- Bewertung: {rating} von 5 Sternen aus {review_count} Bewertungen
+- Verifizierungsstatus: {verified}
+- Status: {business_status}
+- Zusätzliche Informationen: {about}
 
 Unsere Unternehmensdetails:
 - Firmenname: ExposeProfi
@@ -101,6 +85,140 @@ Richtlinien für den E-Mail-Inhalt:
 
 WICHTIG: Verwende KEINE Phrasen wie "Hier ist die E-Mail" oder "Hier ist eine personalisierte E-Mail" - beginne direkt mit "Betreff:"
 """
+
+SYSTEM_PROMPT = "Du bist ein professioneller E-Mail-Verfasser, spezialisiert auf Geschäftsentwicklung. Du schreibst direkte, überzeugende E-Mails mit kreativen, personalisierten Betreffzeilen auf Deutsch. Deine E-Mails enthalten niemals Meta-Kommentare oder Erklärungen. Wenn du eine E-Mail schreibst, beginnst du direkt mit der Betreffzeile und nichts anderem davor."
+
+# Lead fields referenced by the prompt and the word count of its fixed text
+PROMPT_FIELDS = [field for _, field, _, _ in string.Formatter().parse(PROMPT_TEMPLATE) if field]
+PROMPT_TEMPLATE_WORDS = len(PROMPT_TEMPLATE.split()) - len(PROMPT_FIELDS)
+
+# Subject line of a generated email and everything after it
+SUBJECT_PATTERN = re.compile(r'Betreff:\s*([^\n]*)(.*)', re.DOTALL)
+
+# Characters turned into underscores in email filenames, and the characters removed from them
+FILENAME_SEPARATORS = str.maketrans(' /\\', '___')
+UNSAFE_FILENAME_CHARS = re.compile(r'[^\w-]+')
+
+class LeadFields(dict):
+    """Lead data for the prompt template, with missing fields rendered as empty strings"""
+    def __missing__(self, key):
+        return ''
+
+class TokenRateLimiter:
+    """
+    Manages API rate limiting with a token bucket that refills continuously.
+    The refill rate adapts to the API's feedback: it grows additively after
+    successful requests and is cut multiplicatively when the API answers 429.
+    """
+    MAX_RATE_MULTIPLIER = 2.0  # Ceiling for the refill rate, relative to the configured rate
+    RATE_INCREASE = 0.05  # Additive increase per success, relative to the configured rate
+    RATE_DECREASE = 0.5  # Multiplicative decrease per 429 response
+    
+    def __init__(self, tokens_per_minute=6000):
+        self.tokens_per_minute = tokens_per_minute
+        self.capacity = tokens_per_minute
+        self.base_rate = tokens_per_minute / 60.0  # Tokens refilled per second
+        self.rate = self.base_rate
+        self.max_rate = self.base_rate * self.MAX_RATE_MULTIPLIER
+        self.min_rate = tokens_per_minute / 600.0  # Floor for the refill rate
+        self.tokens = float(tokens_per_minute)
+        self.last_refill = time.monotonic()
+        # Concurrent requests share the bucket, so guard its bookkeeping
+        self.lock = asyncio.Lock()
+    
+    def refill(self):
+        """Add the tokens accumulated since the last refill, up to capacity"""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.last_refill) * self.rate)
+        self.last_refill = now
+    
+    async def request_permission(self, estimated_tokens=1500):
+        """
+        Check if a request with estimated token usage can be made.
+        When permission is granted the estimate is taken from the bucket
+        immediately so that concurrent requests cannot overdraw it.
+        Returns: seconds to wait (0 if no wait needed)
+        """
+        # A request larger than the bucket could never be admitted
+        estimated_tokens = min(estimated_tokens, self.capacity)
+        
+        async with self.lock:
+            self.refill()
+            
+            # If we have enough tokens, grant permission immediately
+            if self.tokens >= estimated_tokens:
+                self.tokens -= estimated_tokens
+                return 0
+            
+            # Calculate time until enough tokens have been refilled
+            return (estimated_tokens - self.tokens) / self.rate
+    
+    async def record_usage(self, tokens_used, estimated_tokens=0):
+        """Reconcile the bucket with the actual token usage of a granted request"""
+        async with self.lock:
+            self.tokens = min(self.capacity, self.tokens + estimated_tokens - tokens_used)
+    
+    async def increase_rate(self):
+        """Raise the refill rate after a successful request"""
+        async with self.lock:
+            self.refill()
+            self.rate = min(self.max_rate, self.rate + self.base_rate * self.RATE_INCREASE)
+    
+    async def decrease_rate(self):
+        """Cut the refill rate and empty the bucket after the API reports a rate limit"""
+        async with self.lock:
+            self.refill()
+            self.rate = max(self.min_rate, self.rate * self.RATE_DECREASE)
+            self.tokens = 0.0
+
+def iter_leads_from_csv(file_path):
+    """Read lead data from CSV file, yielding one row at a time"""
+    with open(file_path, mode='r', newline='', encoding='utf-8') as file:
+        yield from csv.DictReader(file)
+
+def create_groq_session(max_connections):
+    """Create a pooled HTTP session for the Groq API, with its headers set once"""
+    # Keep connections (and their TLS sessions) alive across leads and cache DNS lookups
+    connector = aiohttp.TCPConnector(limit=max_connections, ttl_dns_cache=300)
+    return aiohttp.ClientSession(connector=connector, headers=GROQ_HEADERS)
+
+def parse_retry_after(value):
+    """
+    Convert a Retry-After header into seconds to wait.
+    The header holds either a number of seconds or an HTTP date.
+    Returns None if the header is missing or invalid; an endless wait comes back as infinity.
+    """
+    if not value:
+        return None
+    try:
+        seconds = float(value)
+    except ValueError:
+        pass
+    else:
+        return None if math.isnan(seconds) else max(0.0, seconds)
+    try:
+        retry_at = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    # Dates in the -0000 zone come back without a timezone; they are UTC
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+
+def retry_backoff(attempt):
+    """Seconds to wait before retrying after the given (zero-based) failed attempt"""
+    return 5 * 2 ** attempt
+
+def build_prompt(lead):
+    """Construct the prompt with lead data - now in German"""
+    return PROMPT_TEMPLATE.format_map(LeadFields(lead))
+
+def hash_prompt(prompt):
+    """Fingerprint a prompt so that leads with unchanged data are recognized on later runs"""
+    return hashlib.sha256(prompt.encode('utf-8')).hexdigest()
+
+async def generate_email_with_groq(lead, prompt, rate_limiter, session):
+    lead_fields = LeadFields(lead)
     
     # Prepare the request payload
     payload = {
@@ -111,7 +229,7 @@ WICHTIG: Verwende KEINE Phrasen wie "Hier ist die E-Mail" oder "Hier ist eine pe
         "messages": [
             {
                 "role": "system",
-                "content": "Du bist ein professioneller E-Mail-Verfasser, spezialisiert auf Geschäftsentwicklung. Du schreibst direkte, überzeugende E-Mails mit kreativen, personalisierten Betreffzeilen auf Deutsch. Deine E-Mails enthalten niemals Meta-Kommentare oder Erklärungen. Wenn du eine E-Mail schreibst, beginnst du direkt mit der Betreffzeile und nichts anderem davor."
+                "content": SYSTEM_PROMPT
             },
             {
                 "role": "user",
@@ -122,36 +240,55 @@ WICHTIG: Verwende KEINE Phrasen wie "Hier ist die E-Mail" oder "Hier ist eine pe
         "temperature": 0.7  # Slightly increased temperature for more creative subject lines
     }
     
-    # Estimate token usage (prompt + response)
-    estimated_prompt_tokens = len(prompt.split()) * 1.3  # rough estimation
+    # Estimate token usage (prompt + response); only the lead's own fields need counting,
+    # and their words are counted from the spaces between them rather than by splitting
+    lead_words = 0
+    for field in PROMPT_FIELDS:
+        value = str(lead_fields[field])
+        if value:
+            lead_words += value.count(' ') + 1
+    estimated_prompt_tokens = int((PROMPT_TEMPLATE_WORDS + lead_words) * 1.3)  # rough estimation
     estimated_tokens = estimated_prompt_tokens + 1024  # max output tokens
     
     # Check rate limit and wait if necessary
-    wait_time = rate_limiter.request_permission(estimated_tokens)
-    if wait_time > 0:
-        print(f"Rate limit approaching: Waiting {wait_time} seconds before next request...")
-        time.sleep(wait_time)
+    while True:
+        wait_time = await rate_limiter.request_permission(estimated_tokens)
+        if wait_time <= 0:
+            break
+        print(f"Rate limit approaching: Waiting {wait_time:.1f} seconds before next request...")
+        await asyncio.sleep(wait_time)
+    
+    # The same prompt always gets the same key, so retries (and re-runs) of a request
+    # that already reached the API are not billed or answered twice
+    headers = {"Idempotency-Key": str(uuid.uuid5(IDEMPOTENCY_NAMESPACE, prompt))}
     
     # Make the API request
     max_retries = 3
     for attempt in range(max_retries):
         try:
-            response = requests.post(url, headers=headers, json=payload)
-            
-            # Handle rate limit response specifically
-            if response.status_code == 429:
-                if attempt < max_retries - 1:
-                    wait_time = 60  # Default to 60 seconds if no header
-                    if 'Retry-After' in response.headers:
-                        wait_time = int(response.headers['Retry-After'])
-                    print(f"Rate limit exceeded: Waiting {wait_time} seconds (Attempt {attempt+1}/{max_retries})")
-                    time.sleep(wait_time)
-                    continue
-            
-            response.raise_for_status()  # Raise an exception for other HTTP errors
+            async with session.post(GROQ_API_URL, headers=headers, json=payload) as response:
+                # Handle rate limit response specifically
+                if response.status == 429:
+                    await rate_limiter.decrease_rate()
+                    if attempt < max_retries - 1:
+                        # Honor the server's Retry-After, falling back to exponential backoff
+                        wait_time = parse_retry_after(response.headers.get('Retry-After'))
+                        if wait_time is None:
+                            wait_time = retry_backoff(attempt)
+                        elif wait_time > MAX_RETRY_AFTER_WAIT:
+                            # The limit may be a daily quota, so do not sleep until it resets
+                            return f"Error: Rate limit exceeded, retry only possible in {wait_time:.0f} seconds"
+                        response.release()
+                        print(f"Rate limit exceeded: Waiting {wait_time:.1f} seconds (Attempt {attempt+1}/{max_retries})")
+                        await asyncio.sleep(wait_time)
+                        continue
+                
+                response.raise_for_status()  # Raise an exception for other HTTP errors
+                await rate_limiter.increase_rate()
+                
+                # Parse the response
+                result = await response.json(loads=load_json)
             
-            # Parse the response
-            result = response.json()
             if 'choices' in result and len(result['choices']) > 0:
                 email_content = result['choices'][0]['message']['content']
                 
@@ -165,18 +302,18 @@ WICHTIG: Verwende KEINE Phrasen wie "Hier ist die E-Mail" oder "Hier ist eine pe
                 # Record actual token usage
                 usage = result.get('usage', {})
                 total_tokens = usage.get('total_tokens', estimated_tokens)
-                rate_limiter.record_usage(total_tokens)
+                await rate_limiter.record_usage(total_tokens, estimated_tokens)
                 
                 print(f"Request used {total_tokens} tokens")
                 return email_content
             else:
                 return f"Error: Unable to generate email for {lead.get('name', '')}"
                 
-        except requests.exceptions.RequestException as e:
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
             if attempt < max_retries - 1:
-                wait_time = 5 * (attempt + 1)  # Exponential backoff
+                wait_time = retry_backoff(attempt)
                 print(f"API Error: {str(e)}. Retrying in {wait_time} seconds... (Attempt {attempt+1}/{max_retries})")
-                time.sleep(wait_time)
+                await asyncio.sleep(wait_time)
             else:
                 return f"API Error after {max_retries} attempts: {str(e)}"
         except Exception as e:
@@ -184,36 +321,18 @@ WICHTIG: Verwende KEINE Phrasen wie "Hier ist die E-Mail" oder "Hier ist eine pe
 
 def parse_email_content(email_content):
     """Extract subject and body from the email content"""
-    # Default values in case parsing fails
-    subject = ""
-    body = email_content
-    
-    # Find the subject line (now in German)
-    if "Betreff:" in email_content:
-        parts = email_content.split("Betreff:", 1)
-        if len(parts) > 1:
-            # Get everything after "Betreff:"
-            content = parts[1].strip()
-            
-            # Find the first line break after the subject
-            line_break_index = content.find('\n')
-            if line_break_index != -1:
-                subject = content[:line_break_index].strip()
-                body = content[line_break_index:].strip()
-            else:
-                subject = content
-                body = ""
+    # Find the subject line (now in German); default to the whole content as body
+    match = SUBJECT_PATTERN.search(email_content)
+    if match is None:
+        return "", email_content
     
-    return subject, body
+    return match.group(1).strip(), match.group(2).strip()
 
 def save_email(lead, email_content, output_dir):
     """Save the generated email to a file"""
     # Create a safe filename from the business name
-    safe_name = lead.get('name', 'unknown').replace(' ', '_').replace('/', '_').replace('\\', '_')
-    safe_name = ''.join(c for c in safe_name if c.isalnum() or c in ['_', '-'])
-    
-    # Create the output directory if it doesn't exist
-    os.makedirs(output_dir, exist_ok=True)
+    safe_name = lead.get('name', 'unknown').translate(FILENAME_SEPARATORS)
+    safe_name = UNSAFE_FILENAME_CHARS.sub('', safe_name)
     
     # Write the email to a file
     file_path = os.path.join(output_dir, f"{safe_name}_email.txt")
@@ -222,53 +341,183 @@ def save_email(lead, email_content, output_dir):
     
     return file_path
 
-def update_json_file(email_data, json_file_path):
-    """Update the JSON file with new email data in real-time"""
-    # Create directory if it doesn't exist
-    os.makedirs(os.path.dirname(json_file_path), exist_ok=True)
+def dump_json(obj, indent=False):
+    """Serialize an object to UTF-8 encoded JSON bytes, using orjson when available"""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2 if indent else 0)
+    return json.dumps(obj, ensure_ascii=False, indent=2 if indent else None).encode('utf-8')
+
+def load_json(data):
+    """Parse JSON from bytes or str, using orjson when available"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+class EmailRecordBuffer:
+    """Collects email records in memory and appends them to the JSON Lines output in batches"""
+    def __init__(self, jsonl_file, batch_size=50):
+        self.jsonl_file = jsonl_file
+        self.batch_size = batch_size
+        self.pending = []
+        self.count = 0
     
-    # Load existing data if file exists
-    all_emails = []
-    if os.path.exists(json_file_path):
-        try:
-            with open(json_file_path, 'r', encoding='utf-8') as json_file:
-                all_emails = json.load(json_file)
-        except json.JSONDecodeError:
-            # If the file exists but is empty or invalid JSON, start with an empty list
-            all_emails = []
+    def append(self, email_data):
+        """Buffer one email record, flushing once a full batch has accumulated"""
+        self.pending.append(email_data)
+        self.count += 1
+        if len(self.pending) >= self.batch_size:
+            self.flush()
     
-    # Append new email data
-    all_emails.append(email_data)
+    def flush(self):
+        """Write all buffered records to the JSON Lines output in a single write"""
+        if not self.pending:
+            return
+        self.jsonl_file.write(b''.join(dump_json(email_data) + b'\n' for email_data in self.pending))
+        self.jsonl_file.flush()
+        self.pending.clear()
+
+def seed_jsonl_from_json(json_file_path, jsonl_file_path):
+    """
+    Start the JSON Lines output from an existing JSON array when there is no JSON Lines file yet,
+    so emails generated before the switch to JSON Lines are kept and not generated again.
+    Returns the number of records carried over.
+    """
+    if os.path.exists(jsonl_file_path) or not os.path.exists(json_file_path):
+        return 0
+    
+    with open(json_file_path, 'rb') as json_file:
+        try:
+            all_emails = load_json(json_file.read())
+        except ValueError:
+            # An empty or invalid JSON file has nothing to carry over
+            return 0
     
-    # Write updated data back to file
-    with open(json_file_path, 'w', encoding='utf-8') as json_file:
-        json.dump(all_emails, json_file, indent=2)
+    # Write to a temporary file first so an interrupted seed is not mistaken for real output
+    tmp_file_path = jsonl_file_path.with_name(jsonl_file_path.name + '.tmp')
+    with open(tmp_file_path, 'wb') as jsonl_file:
+        jsonl_file.write(b''.join(dump_json(email_data) + b'\n' for email_data in all_emails))
+    os.replace(tmp_file_path, jsonl_file_path)
     
     return len(all_emails)
 
-def main():
-    # Define file paths from environment variables
-    leads_csv_path = Path(os.getenv('LEADS_CSV_PATH', 'venv/data/leads.csv'))
-    output_dir = Path(os.getenv('OUTPUT_DIR', 'venv/data/emails'))
-    json_output_path = Path(os.getenv('JSON_OUTPUT_PATH', 'venv/data/outreach_emails.json'))
+def iter_jsonl_records(jsonl_file_path):
+    """
+    Read the records of a JSON Lines file, yielding one at a time.
+    Lines that cannot be decoded, such as one cut short by an interrupted write, are skipped with a warning.
+    """
+    with open(jsonl_file_path, 'rb') as jsonl_file:
+        for line_number, line in enumerate(jsonl_file, 1):
+            if not line.strip():
+                continue
+            try:
+                yield load_json(line)
+            except ValueError:
+                print(f"Warning: Skipping unreadable record on line {line_number} of {jsonl_file_path}")
+
+def truncate_partial_record(jsonl_file_path):
+    """
+    Cut off a last record left incomplete by an interrupted write,
+    so that newly appended records start on a line of their own.
+    """
+    if not os.path.exists(jsonl_file_path):
+        return
     
-    # Create rate limiter with rate from environment variable
-    tokens_per_minute = int(os.getenv('TOKENS_PER_MINUTE', 6000))
-    rate_limiter = TokenRateLimiter(tokens_per_minute=tokens_per_minute)
+    with open(jsonl_file_path, 'r+b') as jsonl_file:
+        size = jsonl_file.seek(0, os.SEEK_END)
+        if size == 0:
+            return
+        jsonl_file.seek(size - 1)
+        if jsonl_file.read(1) == b'\n':
+            return
+        
+        # Scan back in blocks for the end of the last complete line
+        line_end = size
+        while line_end > 0:
+            block_start = max(0, line_end - 4096)
+            jsonl_file.seek(block_start)
+            newline_index = jsonl_file.read(line_end - block_start).rfind(b'\n')
+            if newline_index != -1:
+                line_end = block_start + newline_index + 1
+                break
+            line_end = block_start
+        
+        jsonl_file.seek(line_end)
+        last_line = jsonl_file.read()
+        try:
+            load_json(last_line)
+        except ValueError:
+            print(f"Warning: Removing incomplete last record from {jsonl_file_path}")
+            jsonl_file.truncate(line_end)
+        else:
+            # The last record is complete and only lacks its line break
+            jsonl_file.write(b'\n')
+
+def load_processed_keys(jsonl_file_path):
+    """
+    Collect the keys of leads that already have an email in the JSON Lines output.
+    Records are keyed by their prompt hash and recipient address; records written
+    before hashes were stored are keyed by their recipient address alone.
+    """
+    processed = set()
+    if not os.path.exists(jsonl_file_path):
+        return processed
     
-    # Ensure the leads CSV exists
-    if not leads_csv_path.exists():
-        print(f"Error: {leads_csv_path} not found!")
-        return
+    for email_data in iter_jsonl_records(jsonl_file_path):
+        prompt_hash = email_data.get('prompt_hash')
+        recipient_email = email_data.get('to')
+        processed.add((prompt_hash, recipient_email) if prompt_hash else recipient_email)
+    return processed
+
+def convert_jsonl_to_json(jsonl_file_path, json_file_path):
+    """Aggregate the JSON Lines output into the JSON array read by email_sender"""
+    all_emails = list(iter_jsonl_records(jsonl_file_path))
     
-    # Read leads from CSV
-    print(f"Reading leads from {leads_csv_path}...")
-    leads = read_leads_from_csv(leads_csv_path)
-    print(f"Found {len(leads)} leads")
+    # Write to a temporary file first so readers never see a partially written array
+    tmp_file_path = json_file_path.with_name(json_file_path.name + '.tmp')
+    with open(tmp_file_path, 'wb') as json_file:
+        json_file.write(dump_json(all_emails, indent=True))
+    os.replace(tmp_file_path, json_file_path)
+    
+    return len(all_emails)
+
+def save_generated_email(recipient_email, prompt_hash, email_content, email_records):
+    """
+    Add a generated email to the JSON output.
+    Returns True if the email was generated successfully, False otherwise.
+    """
+    # Add the email to the JSON structure
+    success = bool(email_content) and not email_content.startswith("Error:") and not email_content.startswith("API Error:")
+    if success:
+        # Parse subject and body
+        subject, body = parse_email_content(email_content)
+        
+        # Create email data structure
+        email_data = {
+            "subject": subject,
+            "from": EMAIL_FROM,
+            "to": recipient_email,
+            "body": body,
+            "prompt_hash": prompt_hash
+        }
+        
+        # Buffer the record; it is appended to the JSON Lines file with its batch
+        email_records.append(email_data)
+        print(f"Added email to JSON output (total: {email_records.count}) with subject: {subject}")
+    else:
+        print(f"Failed to generate email: {email_content}")
     
-    # Process each lead
-    for i, lead in enumerate(leads, 1):
-        print(f"Processing lead {i}/{len(leads)}: {lead.get('name', 'Unknown')}")
+    print("-" * 50)
+    return success
+
+async def queue_leads(leads_csv_path, queue, worker_count, processed):
+    """
+    Stream leads from the CSV into the queue, followed by one stop marker per worker.
+    Leads whose key is in processed already have an email and are not queued again.
+    """
+    lead_count = 0
+    for i, lead in enumerate(iter_leads_from_csv(leads_csv_path), 1):
+        lead_count = i
+        print(f"Queueing lead {i}: {lead.get('name', 'Unknown')}")
         
         # Skip leads without a name or email
         if not lead.get('name'):
@@ -284,36 +533,96 @@ def main():
             print(f"Skipping lead without an email address: {lead.get('name')}")
             continue
         
-        # Generate the email
-        print("Generating personalized email in German...")
-        email_content = generate_email_with_groq(lead, rate_limiter)
+        # Skip leads already handled by a previous run or earlier in this CSV; the prompt
+        # does not include the recipient, so a changed address still gets its own email
+        prompt = build_prompt(lead)
+        prompt_hash = hash_prompt(prompt)
+        if (prompt_hash, recipient_email) in processed or recipient_email in processed:
+            print(f"Skipping lead with an existing email: {lead.get('name')}")
+            continue
+        processed.add((prompt_hash, recipient_email))
         
-        # Save the email and add to JSON structure
-        if email_content and not email_content.startswith("Error:") and not email_content.startswith("API Error:"):
-            # Save to text file
-            file_path = save_email(lead, email_content, output_dir)
-            print(f"Email saved to {file_path}")
-            
-            # Parse subject and body
-            subject, body = parse_email_content(email_content)
-            
-            # Create email data structure
-            email_data = {
-                "subject": subject,
-                "from": os.getenv('EMAIL_FROM', 'MS_GmoyJz@trial-o65qngken68gwr12.mlsender.net'),
-                "to": recipient_email,
-                "body": body
-            }
-            
-            # Update JSON file in real-time
-            email_count = update_json_file(email_data, json_output_path)
-            print(f"Added email to JSON file (total: {email_count}) with subject: {subject}")
-        else:
-            print(f"Failed to generate email: {email_content}")
+        # Blocks while the queue is full, so reading never runs far ahead of the workers
+        await queue.put((lead, recipient_email, prompt, prompt_hash))
+    
+    for _ in range(worker_count):
+        await queue.put(None)
+    return lead_count
+
+async def email_worker(queue, rate_limiter, session, output_dir, email_records, file_executor, file_writes):
+    """Generate and save emails for queued leads until a stop marker is received"""
+    loop = asyncio.get_running_loop()
+    while True:
+        item = await queue.get()
+        if item is None:
+            return
         
-        print("-" * 50)
+        lead, recipient_email, prompt, prompt_hash = item
+        print(f"Generating personalized email in German for {lead.get('name')}...")
+        email_content = await generate_email_with_groq(lead, prompt, rate_limiter, session)
+        if save_generated_email(recipient_email, prompt_hash, email_content, email_records):
+            # Write the text file on a background thread so disk latency stays off the API path;
+            # the writes are only awaited once all leads have been processed
+            file_writes.append(loop.run_in_executor(file_executor, save_email, lead, email_content, output_dir))
+
+async def run_email_generation(leads_csv_path, output_dir, jsonl_output_path, rate_limiter, max_concurrent_requests, json_batch_size):
+    """Generate emails for all leads using a pool of concurrent workers fed from the CSV"""
+    # A bounded queue applies backpressure to the CSV reader
+    queue = asyncio.Queue(maxsize=2 * max_concurrent_requests)
+    
+    # Leads that already have an email are skipped, which makes interrupted runs resumable
+    truncate_partial_record(jsonl_output_path)
+    processed = load_processed_keys(jsonl_output_path)
+    
+    # Records are appended in batches instead of rewriting the whole file per email
+    with open(jsonl_output_path, 'ab') as jsonl_file:
+        email_records = EmailRecordBuffer(jsonl_file, batch_size=json_batch_size)
+        file_writes = []
+        try:
+            with ThreadPoolExecutor(max_workers=2) as file_executor:
+                async with create_groq_session(max_concurrent_requests) as session:
+                    workers = [
+                        email_worker(queue, rate_limiter, session, output_dir, email_records, file_executor, file_writes)
+                        for _ in range(max_concurrent_requests)
+                    ]
+                    lead_count, *_ = await asyncio.gather(
+                        queue_leads(leads_csv_path, queue, max_concurrent_requests, processed),
+                        *workers
+                    )
+                
+                file_paths = await asyncio.gather(*file_writes)
+        finally:
+            # Persist the last partial batch, even if the run was interrupted
+            email_records.flush()
+    
+    print(f"Processed {lead_count} leads")
+    print(f"Saved {len(file_paths)} email files to {output_dir}")
+
+def main():
+    # Create rate limiter with rate from environment variable
+    rate_limiter = TokenRateLimiter(tokens_per_minute=TOKENS_PER_MINUTE)
+    
+    # Ensure the leads CSV exists
+    if not LEADS_CSV_PATH.exists():
+        print(f"Error: {LEADS_CSV_PATH} not found!")
+        return
+    
+    # Create the output directories if they don't exist
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
+    os.makedirs(JSON_OUTPUT_PATH.parent, exist_ok=True)
+    
+    # Carry over the emails of earlier runs that only wrote the JSON array
+    seeded_count = seed_jsonl_from_json(JSON_OUTPUT_PATH, JSONL_OUTPUT_PATH)
+    if seeded_count:
+        print(f"Carried over {seeded_count} existing emails from {JSON_OUTPUT_PATH}")
+    
+    # Stream leads from the CSV into the concurrent workers
+    print(f"Reading leads from {LEADS_CSV_PATH}...")
+    asyncio.run(run_email_generation(LEADS_CSV_PATH, OUTPUT_DIR, JSONL_OUTPUT_PATH, rate_limiter, MAX_CONCURRENT_REQUESTS, JSON_BATCH_SIZE))
     
-    print(f"All emails saved to JSON file: {json_output_path}")
+    # Materialize the JSON array once, now that all records have been appended
+    email_count = convert_jsonl_to_json(JSONL_OUTPUT_PATH, JSON_OUTPUT_PATH)
+    print(f"All {email_count} emails saved to JSON file: {JSON_OUTPUT_PATH}")
     print("Email generation complete!")
 
 if __name__ == "__main__":
@@ -1,19 +1,56 @@
-import smtplib
+import asyncio
+import aiosmtplib
 import json
 import os
+import re
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
 from pathlib import Path
 from dotenv import load_dotenv
+from email_composer import load_json, main as run_main_campaign
 
 # Load environment variables from .env file
 load_dotenv(Path("venv/.env"))
 
+# SMTP settings from environment variables, read once at import
+SMTP_SERVER = os.environ.get('SMTP_SERVER', 'smtp.mailersend.net')
+SMTP_PORT = int(os.environ.get('SMTP_PORT', 587))
+SMTP_USERNAME = os.environ.get('SMTP_USERNAME', '')
+SMTP_PASSWORD = os.environ.get('SMTP_PASSWORD', '')
+SMTP_MAX_CONNECTIONS = int(os.environ.get('SMTP_MAX_CONNECTIONS', 10))
+
+# Blank lines separating paragraphs, and the line that opens the signature
+PARAGRAPH_BREAK_PATTERN = re.compile(r'\n\n+')
+SIGNATURE_PATTERN = re.compile(r'^\s*Mit freundlichen Grüßen', re.MULTILINE)
+
+# Static parts of the HTML document for test emails; only the original
+# recipient and the body are inserted between them per email
+TEST_EMAIL_HEAD = """
+    <!DOCTYPE html>
+    <html>
+      <head>
+        <meta charset="UTF-8">
+        <style>
+          body { font-family: Arial, sans-serif; line-height: 1.5; color: #333; }
+          p { margin-bottom: 15px; }
+        </style>
+      </head>
+      <body>
+        <div style="background-color: #f8f8f8; padding: 10px; margin-bottom: 20px; border-left: 4px solid #ff9900;">
+          <strong>TEST EMAIL</strong> - This is a test email for the upcoming campaign. Original recipient would have been: """
+TEST_EMAIL_BANNER_END = """
+        </div>
+        """
+TEST_EMAIL_TAIL = """
+      </body>
+    </html>
+    """
+
 def read_outreach_emails(json_path):
     """Read the outreach emails from JSON file"""
     try:
-        with open(json_path, 'r', encoding='utf-8') as file:
-            emails = json.load(file)
+        with open(json_path, 'rb') as file:
+            emails = load_json(file.read())
             print(f"Successfully loaded {len(emails)} emails from {json_path}")
             return emails
     except FileNotFoundError:
@@ -28,47 +65,110 @@ def read_outreach_emails(json_path):
 
 def format_html_body(body_text):
     """Format the plain text body into proper HTML"""
-    # Split the text into paragraphs
-    paragraphs = body_text.split('\n\n')
-    
-    # Format each paragraph with proper HTML
+    # Format each non-empty paragraph with proper HTML
     html_paragraphs = []
-    for paragraph in paragraphs:
+    for paragraph in PARAGRAPH_BREAK_PATTERN.split(body_text):
         if paragraph.strip():
             # Handle signature section differently (after "Mit freundlichen Grüßen")
-            if "Mit freundlichen Grüßen" in paragraph:
+            if SIGNATURE_PATTERN.search(paragraph):
                 # Split the signature part and format it
                 sig_parts = paragraph.split('\n')
-                sig_html = '<p>' + sig_parts[0] + '</p>'
+                sig_html = ['<p>', sig_parts[0], '</p>']
                 
                 # Add the remaining signature lines with line breaks
                 if len(sig_parts) > 1:
-                    sig_html += '<p style="margin-top: 0;">'
-                    sig_html += '<br>'.join(sig_parts[1:])
-                    sig_html += '</p>'
+                    sig_html.extend(['<p style="margin-top: 0;">', '<br>'.join(sig_parts[1:]), '</p>'])
                 
-                html_paragraphs.append(sig_html)
+                html_paragraphs.append(''.join(sig_html))
             else:
                 # Regular paragraph
-                formatted = '<p>' + paragraph.replace('\n', '<br>') + '</p>'
-                html_paragraphs.append(formatted)
+                html_paragraphs.append(''.join(['<p>', paragraph.replace('\n', '<br>'), '</p>']))
     
     # Join all paragraphs into a single HTML body
-    html_body = '\n'.join(html_paragraphs)
+    return '\n'.join(html_paragraphs)
+
+class SMTPSender:
+    """
+    Keeps one authenticated SMTP connection open across several sends.
+    The connection is opened on the first send and re-established if the
+    server drops it, so the STARTTLS handshake and login happen once per batch.
+    """
+    def __init__(self, smtp_server=SMTP_SERVER, port=SMTP_PORT, username=SMTP_USERNAME, password=SMTP_PASSWORD):
+        self.smtp_server = smtp_server
+        self.port = port
+        self.username = username
+        self.password = password
+        self.server = None
+    
+    async def __aenter__(self):
+        return self
     
-    return html_body
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+    
+    async def connect(self):
+        """Open a secure, authenticated connection to the SMTP server"""
+        await self.close()
+        server = aiosmtplib.SMTP(hostname=self.smtp_server, port=self.port, start_tls=False)
+        await server.connect()
+        try:
+            await server.starttls()  # Secure the connection
+            await server.login(self.username, self.password)
+        except Exception:
+            server.close()
+            raise
+        self.server = server
+    
+    async def close(self):
+        """Close the connection if one is open"""
+        if self.server is None:
+            return
+        try:
+            await self.server.quit()
+        except (aiosmtplib.SMTPException, OSError):
+            self.server.close()
+        self.server = None
+    
+    async def send(self, from_email, to_email, message):
+        """Send a message over the open connection, reconnecting once if it was dropped"""
+        if self.server is None:
+            await self.connect()
+        try:
+            await self.server.sendmail(from_email, [to_email], message)
+        except aiosmtplib.SMTPServerDisconnected:
+            await self.connect()
+            await self.server.sendmail(from_email, [to_email], message)
+
+async def send_emails(messages, max_connections=SMTP_MAX_CONNECTIONS):
+    """
+    Send (from_email, to_email, message) tuples concurrently.
+    An SMTP connection carries one message at a time, so up to max_connections
+    connections are opened and each one sends messages from a shared queue.
+    Returns the error for each message, in order (None if it was sent).
+    """
+    queue = asyncio.Queue()
+    for index, message in enumerate(messages):
+        queue.put_nowait((index, message))
+    errors = [None] * len(messages)
+    
+    async def send_from_queue():
+        async with SMTPSender() as sender:
+            while not queue.empty():
+                index, (from_email, to_email, message) = queue.get_nowait()
+                # One failed message must not stop the rest of the batch
+                try:
+                    await sender.send(from_email, to_email, message)
+                except Exception as e:
+                    errors[index] = e
+    
+    await asyncio.gather(*(send_from_queue() for _ in range(min(max_connections, len(messages)))))
+    return errors
 
 def send_test_email(email_data, test_recipient):
     """Send a test email using the same SMTP configuration"""
-    # Get SMTP settings from environment variables
-    smtp_server = os.environ.get('SMTP_SERVER', 'smtp.mailersend.net')
-    port = int(os.environ.get('SMTP_PORT', 587))
-    username = os.environ.get('SMTP_USERNAME', '')
-    password = os.environ.get('SMTP_PASSWORD', '')
-    
     # Extract email data
     subject = "[TEST] " + email_data.get('subject', 'No Subject')
-    from_email = email_data.get('from', username)
+    from_email = email_data.get('from', SMTP_USERNAME)
     body_text = email_data.get('body', '')
     
     # Create message
@@ -81,43 +181,28 @@ def send_test_email(email_data, test_recipient):
     part1 = MIMEText(body_text, 'plain', 'utf-8')
     
     # Create the HTML version with proper formatting
-    html_content = f"""
-    <!DOCTYPE html>
-    <html>
-      <head>
-        <meta charset="UTF-8">
-        <style>
-          body {{ font-family: Arial, sans-serif; line-height: 1.5; color: #333; }}
-          p {{ margin-bottom: 15px; }}
-        </style>
-      </head>
-      <body>
-        <div style="background-color: #f8f8f8; padding: 10px; margin-bottom: 20px; border-left: 4px solid #ff9900;">
-          <strong>TEST EMAIL</strong> - This is a test email for the upcoming campaign. Original recipient would have been: {email_data.get('to', 'N/A')}
-        </div>
-        {format_html_body(body_text)}
-      </body>
-    </html>
-    """
+    html_content = ''.join([
+        TEST_EMAIL_HEAD,
+        email_data.get('to', 'N/A'),
+        TEST_EMAIL_BANNER_END,
+        format_html_body(body_text),
+        TEST_EMAIL_TAIL
+    ])
     part2 = MIMEText(html_content, 'html', 'utf-8')
     
     # Add HTML/plain-text parts to MIMEMultipart message
     msg.attach(part1)
     msg.attach(part2)
     
-    try:
-        # Create secure connection with server and send email
-        server = smtplib.SMTP(smtp_server, port)
-        server.starttls()  # Secure the connection
-        server.login(username, password)
-        server.sendmail(from_email, test_recipient, msg.as_string())
-        server.quit()
+    # Create secure connection with server and send email
+    error, = asyncio.run(send_emails([(from_email, test_recipient, msg.as_bytes())], max_connections=1))
+    if error is None:
         print(f"✓ Test email successfully sent to {test_recipient}")
         print(f"  Subject: {subject}")
         return True
-    except Exception as e:
-        print(f"✗ Failed to send test email to {test_recipient}: {e}")
-        return False
+    
+    print(f"✗ Failed to send test email to {test_recipient}: {error}")
+    return False
 
 def main():
     """Send a test email before running the main campaign"""
@@ -164,8 +249,7 @@ def main():
             continue_response = input("\nProceed with the main email campaign? (yes/no): ").strip().lower()
             if continue_response in ['yes', 'y']:
                 print("\nProceeding to main campaign...")
-                # Import and call the main function from the original script
-                from email_composer import main as run_main_campaign
+                # Call the main function from the original script
                 run_main_campaign()
                 break
             elif continue_response in ['no', 'n']:
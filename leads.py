@@ -1,166 +1,411 @@
-import http.client
+import asyncio
 import json
 import csv
+import logging
+import functools
 import os
+import queue
+import types
+import aiohttp
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+from urllib.parse import quote, urlencode
 from dotenv import load_dotenv
 
-load_dotenv(Path("venv/.env"))
+try:
+    import orjson
+except ImportError:  # Fall back to the standard library json module
+    orjson = None
 
-def fetch_business_data():
+log = logging.getLogger(__name__)
+
+RAPIDAPI_BASE_URL = "https://local-business-data.p.rapidapi.com"
+
+# Parameters of the search-in-area request
+SEARCH_QUERY_PARAMS = {
+    'query': 'Real estate, Real estate management, Interior Design',
+    'lat': '52.520008',
+    'lng': '13.404954',
+    'zoom': '10',
+    'limit': '100',
+    'language': 'en',
+    'region': 'de',
+    'subtypes': 'Real estate, Real estate agency, Real estate surveyor, Real estate developer, '
+                'Architect, Apartment rental agency, Architectural designer, Architecture firm, '
+                'Blueprint service, Building designer, Building firm, Service establishment, '
+                'Housing development',
+    'extract_emails_and_contacts': 'true'
+}
+
+# Search queries to run; each one is a search-in-area request path, encoded once at import
+SEARCH_QUERY_PATHS = [
+    "/search-in-area?" + urlencode(SEARCH_QUERY_PARAMS, quote_via=quote)
+]
+
+# Maximum number of search requests in flight at once
+MAX_CONCURRENT_REQUESTS = 64
+
+# Longest wait for a RapidAPI rate limit window to reset before giving up, in seconds
+MAX_RATE_LIMIT_WAIT = 60
+
+# Size of the CSV file's write buffer (1 MiB)
+CSV_BUFFER_SIZE = 1 << 20
+
+# Maximum number of rows waiting for the background CSV writer
+CSV_QUEUE_SIZE = 1024
+
+# Columns written first to the CSV, in this order
+PRIORITY_FIELDS = ('business_id', 'name', 'phone_numbers', 'emails', 'social_media')
+
+# Columns never written to the CSV
+EXCLUDED_COLUMNS = frozenset({
+    'google_id', 'place_id', 'google_mid', 'phone_number', 'place_link', 'cid', 'owner_id',
+    'latitude', 'longitude', 'working_hours', 'owner_link', 'booking_link',
+    'reservations_link', 'photos_sample', 'reviews_link', 'reviews_per_rating',
+    'photo_count', 'order_link', 'price_level', 'street_address',
+    'emails_and_contacts'  # Exclude this as we'll extract its contents
+})
+
+# Schema of the business fields kept from a search response, in API order. Only these
+# fields are copied out of a parsed response; everything else is dropped immediately.
+# emails_and_contacts is not written to the CSV itself but is flattened into its own columns.
+BUSINESS_FIELDS = (
+    'business_id', 'name', 'full_address', 'review_count', 'rating', 'timezone',
+    'opening_status', 'website', 'verified', 'owner_name', 'business_status', 'type',
+    'subtypes', 'about', 'address', 'district', 'city', 'zipcode', 'state', 'country',
+    'emails_and_contacts'
+)
+
+# Columns of the CSV, in order: the priority columns first, then the remaining schema fields
+CSV_FIELDS = PRIORITY_FIELDS + tuple(
+    field for field in BUSINESS_FIELDS
+    if field not in EXCLUDED_COLUMNS and field not in PRIORITY_FIELDS
+)
+
+@functools.lru_cache(maxsize=1)
+def get_config():
     """
-    Fetch business data from the RapidAPI Local Business Data API
+    Load the .env file and read the settings from the environment, once, on first use
     
     Returns:
-        dict: The API response data or None if the request failed
+        types.SimpleNamespace: The API credentials, output path and response cache path
+    """
+    load_dotenv(Path("venv/.env"))
+    return types.SimpleNamespace(
+        api_key=os.environ.get('RAPIDAPI_KEY'),
+        api_host=os.environ.get('RAPIDAPI_HOST', 'local-business-data.p.rapidapi.com'),
+        csv_path=Path(os.environ.get('LEADS_CSV_PATH', "venv/data/leads.csv")),
+        cache_path=Path(os.environ.get('LEADS_CACHE_PATH', "venv/data/leads_cache.json"))
+    )
+
+def load_json(data):
+    """Parse JSON from bytes or str, using orjson when available"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+def dump_json_text(obj):
+    """Serialize an object to a JSON string, using orjson when available"""
+    if orjson is not None:
+        return orjson.dumps(obj).decode("utf-8")
+    # Match orjson's compact, non-escaped output so the CSV is the same either way
+    return json.dumps(obj, separators=(',', ':'), ensure_ascii=False)
+
+def load_response_cache(cache_path):
+    """
+    Load the cached search responses saved by an earlier run
+    
+    Args:
+        cache_path (Path): Path of the response cache file
+        
+    Returns:
+        dict: The ETag and projected response data of each search request path
     """
     try:
-        conn = http.client.HTTPSConnection("local-business-data.p.rapidapi.com")
+        with open(cache_path, 'rb') as file:
+            return load_json(file.read())
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError):
+        log.warning("Ignoring unreadable response cache %s", cache_path)
+        return {}
+
+def save_response_cache(cache_path, response_cache):
+    """
+    Save the cached search responses for the next run
+    
+    Args:
+        cache_path (Path): Path of the response cache file
+        response_cache (dict): The ETag and projected response data of each search request path
+    """
+    try:
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        # Write to a temporary file first so an interrupted run never leaves a broken cache
+        tmp_file_path = f"{cache_path}.tmp"
+        with open(tmp_file_path, 'w', encoding='utf-8') as file:
+            file.write(dump_json_text(response_cache))
+        os.replace(tmp_file_path, cache_path)
+    except OSError:
+        log.warning("Could not save response cache %s", cache_path, exc_info=True)
+
+async def fetch_search_results(session, semaphore, query_path, headers, response_cache, max_retries=3):
+    """
+    Fetch the results of a single search request, retrying on rate limits and server errors
+    
+    Args:
+        session (aiohttp.ClientSession): The pooled HTTP session
+        semaphore (asyncio.Semaphore): Limits the number of requests in flight
+        query_path (str): The search request path
+        headers (dict): The RapidAPI authentication headers
+        response_cache (dict): The ETag and projected response data of each search request path,
+            revalidated with If-None-Match and updated in place
+        max_retries (int): Number of attempts before giving up
+        
+    Returns:
+        dict: The API response data, projected to BUSINESS_FIELDS, or None if the request failed
+    """
+    cached = response_cache.get(query_path)
+    if cached is not None:
+        headers = {**headers, 'if-none-match': cached['etag']}
+    
+    for attempt in range(max_retries):
+        try:
+            async with semaphore:
+                async with session.get(RAPIDAPI_BASE_URL + query_path, headers=headers) as res:
+                    if res.status == 200:
+                        # Only the fields in the schema are kept, so the bulky unused ones are
+                        # freed with the parsed response instead of living on in the cache
+                        data = {"data": [
+                            {field: item[field] for field in BUSINESS_FIELDS if field in item}
+                            for item in load_json(await res.read()).get('data', [])
+                        ]}
+                        etag = res.headers.get('ETag')
+                        if etag:
+                            response_cache[query_path] = {'etag': etag, 'data': data}
+                        return data
+                    
+                    # The results have not changed since the cached response
+                    if res.status == 304 and cached is not None:
+                        return cached['data']
+                    
+                    retryable = res.status == 429 or res.status >= 500
+                    if not retryable or attempt == max_retries - 1:
+                        log.error("API request failed with status code: %s", res.status)
+                        return None
+                    
+                    # Wait for the rate limit window to reset if RapidAPI reports it, otherwise back off.
+                    # The reset can be days away once the plan quota is used up, so give up instead
+                    wait_time = 2 ** attempt
+                    if res.headers.get('X-RateLimit-Requests-Remaining') == '0':
+                        reset = res.headers.get('X-RateLimit-Requests-Reset', '')
+                        if not reset.isdigit() or int(reset) > MAX_RATE_LIMIT_WAIT:
+                            log.error("API request quota exhausted (resets in %s seconds). Aborting.",
+                                      reset or "unknown")
+                            return None
+                        wait_time = max(wait_time, int(reset))
+                    error = f"status code {res.status}"
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            if attempt == max_retries - 1:
+                log.exception("Error fetching business data")
+                return None
+            wait_time = 2 ** attempt
+            error = str(e) or type(e).__name__
         
-        # Get API key from environment variable
-        api_key = os.environ.get('RAPIDAPI_KEY')
-        api_host = os.environ.get('RAPIDAPI_HOST', 'local-business-data.p.rapidapi.com')
+        log.warning("API request failed (%s): Retrying in %s seconds... (Attempt %d/%d)",
+                    error, wait_time, attempt + 1, max_retries)
+        await asyncio.sleep(wait_time)
+
+async def fetch_all_business_data(query_paths, headers, response_cache):
+    """
+    Run all search requests concurrently over one pooled session and merge their results
+    
+    Args:
+        query_paths (list): The search request paths
+        headers (dict): The RapidAPI authentication headers
+        response_cache (dict): The ETag and projected response data of each search request path
         
+    Returns:
+        dict: The merged API response data or None if every request failed
+    """
+    semaphore = asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)
+    connector = aiohttp.TCPConnector(limit_per_host=MAX_CONCURRENT_REQUESTS, keepalive_timeout=75)
+    timeout = aiohttp.ClientTimeout(total=30)
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+        responses = await asyncio.gather(*[
+            fetch_search_results(session, semaphore, query_path, headers, response_cache)
+            for query_path in query_paths
+        ])
+    
+    responses = [response for response in responses if response is not None]
+    if not responses:
+        return None
+    
+    # Overlapping searches can return the same business more than once
+    businesses = {}
+    for response in responses:
+        for item in response.get('data', []):
+            businesses.setdefault(item.get('business_id') or id(item), item)
+    return {"data": list(businesses.values())}
+
+def fetch_business_data(query_paths=None):
+    """
+    Fetch business data from the RapidAPI Local Business Data API
+    
+    Args:
+        query_paths (list): The search request paths, defaults to SEARCH_QUERY_PATHS
+    
+    Returns:
+        dict: The API response data or None if the request failed
+    """
+    try:
+        # Get API key from the cached configuration
+        config = get_config()
         headers = {
-            'x-rapidapi-key': api_key,
-            'x-rapidapi-host': api_host
+            'x-rapidapi-key': config.api_key,
+            'x-rapidapi-host': config.api_host,
+            # Ask for a compressed response; aiohttp decompresses it transparently
+            'accept-encoding': 'gzip, deflate'
         }
         
-        query_path = "/search-in-area?query=Real%20estate%2C%20Real%20estate%20management%2C%20Interior%20Design&lat=52.520008&lng=13.404954&zoom=10&limit=100&language=en&region=de&subtypes=Real%20estate%2C%20Real%20estate%20agency%2C%20Real%20estate%20surveyor%2C%20Real%20estate%20developer%2C%20Architect%2C%20Apartment%20rental%20agency%2C%20Architectural%20designer%2C%20Architecture%20firm%2C%20Blueprint%20service%2C%20Building%20designer%2C%20Building%20firm%2C%20Service%20establishment%2C%20Housing%20development&extract_emails_and_contacts=true"
+        # Responses from the last run let unchanged searches be answered with an empty 304
+        query_paths = query_paths or SEARCH_QUERY_PATHS
+        response_cache = load_response_cache(config.cache_path)
         
-        print("Fetching business data from API...")
-        conn.request("GET", query_path, headers=headers)
-        
-        res = conn.getresponse()
-        if res.status != 200:
-            print(f"API request failed with status code: {res.status}")
+        log.info("Fetching business data from API...")
+        data = asyncio.run(fetch_all_business_data(query_paths, headers, response_cache))
+        if data is None:
             return None
-            
-        data = json.loads(res.read().decode("utf-8"))
-        print(f"Successfully fetched data for {len(data.get('data', []))} businesses")
+        
+        # Keep only the searches still in use, so the cache cannot grow without bound
+        save_response_cache(config.cache_path, {
+            query_path: response_cache[query_path]
+            for query_path in query_paths if query_path in response_cache
+        })
+        
+        log.info("Successfully fetched data for %d businesses", len(data.get('data', [])))
         return data
-    except Exception as e:
-        print(f"Error fetching business data: {e}")
+    except Exception:
+        log.exception("Error fetching business data")
         return None
 
-def process_business_data(data):
+def process_business(item):
     """
-    Process the business data to extract relevant information
+    Process a single business record to extract its email and contact information
     
     Args:
-        data (dict): The API response data
+        item (dict): A business record from the API response data
         
     Returns:
-        list: Processed business data or empty list if processing failed
+        dict: A new flat record with the CSV columns and flattened contact fields;
+            the input record is left unchanged
     """
-    try:
-        data_list = data.get("data", [])
-        if not data_list:
-            print("No business data found in API response")
-            return []
-            
-        print(f"Processing {len(data_list)} business records...")
-        
-        # Columns to exclude
-        exclude_columns = [
-            'google_id', 'place_id', 'google_mid', 'phone_number', 'place_link', 'cid', 'owner_id',
-            'latitude', 'longitude', 'working_hours', 'owner_link', 'booking_link', 
-            'reservations_link', 'photos_sample', 'reviews_link', 'reviews_per_rating', 
-            'photo_count', 'order_link', 'price_level', 'street_address',
-            'emails_and_contacts'  # Exclude this as we'll extract its contents
-        ]
+    contacts = item.get('emails_and_contacts') or {}
+    if isinstance(contacts, str):
+        try:
+            contacts = load_json(contacts)
+        except ValueError:
+            contacts = {}
+    
+    # Collect all social platforms except emails and phone_numbers
+    social_media = {key: value for key, value in contacts.items()
+                    if value and key not in ('emails', 'phone_numbers')}
+    
+    # Build the output record in one go, so the nested contacts column never reaches the CSV
+    return {
+        **{field: item[field] for field in CSV_FIELDS if field in item},
+        'emails': ",".join(contacts.get('emails') or ()),
+        'phone_numbers': ",".join(contacts.get('phone_numbers') or ()),
+        'social_media': dump_json_text(social_media) if social_media else "{}"
+    }
+
+def iter_processed(data):
+    """
+    Process the business records of an API response lazily, one at a time
+    
+    Args:
+        data (dict): The API response data
         
-        # Process each item to extract email and contact information
-        for item in data_list:
-            # Initialize new fields
-            item['emails'] = ""
-            item['phone_numbers'] = ""
-            item['social_media'] = {}
-            
-            # Extract from emails_and_contacts if it exists and is not None
-            if 'emails_and_contacts' in item and item['emails_and_contacts']:
-                contacts = item['emails_and_contacts']
-                if isinstance(contacts, str):
-                    try:
-                        contacts = json.loads(contacts)
-                    except json.JSONDecodeError:
-                        contacts = {}
-                
-                # Extract emails
-                if 'emails' in contacts and contacts['emails']:
-                    item['emails'] = ",".join(contacts['emails'])
-                
-                # Extract phone numbers
-                if 'phone_numbers' in contacts and contacts['phone_numbers']:
-                    item['phone_numbers'] = ",".join(contacts['phone_numbers'])
-                
-                # Extract social media - collect all social platforms except emails and phone_numbers
-                social_media = {}
-                for key, value in contacts.items():
-                    if key not in ['emails', 'phone_numbers'] and value:
-                        social_media[key] = value
-                
-                # Convert social media dict to JSON string if it's not empty
-                if social_media:
-                    item['social_media'] = json.dumps(social_media)
+    Yields:
+        dict: Each business record with flattened contact fields
+    """
+    for item in data.get('data', ()):
+        yield process_business(item)
+
+def write_csv_rows(row_queue, file):
+    """
+    Write rows from the queue to the CSV file until the end sentinel (None) arrives
+    
+    Args:
+        row_queue (queue.Queue): The rows to write, each a list of column value strings
+        file (file object): The open CSV file
         
-        print(f"Successfully processed {len(data_list)} business records")
-        return data_list
-    except Exception as e:
-        print(f"Error processing business data: {e}")
-        return []
+    Returns:
+        int: The number of rows written
+    """
+    rows = iter(row_queue.get, None)
+    try:
+        # Rows hold only strings, so minimal quoting is all the writer needs to decide
+        writer = csv.writer(file, quoting=csv.QUOTE_MINIMAL)
+        writer.writerow(CSV_FIELDS)
+        record_count = 0
+        for row in rows:
+            writer.writerow(row)
+            record_count += 1
+        return record_count
+    finally:
+        # Drain the queue after a failed write so the producer never blocks on it
+        for _ in rows:
+            pass
 
-def save_to_csv(data_list, file_path):
+def save_to_csv(businesses, file_path):
     """
-    Save the processed business data to a CSV file
+    Save the processed business data to a CSV file, writing each record as it arrives
+    
+    Records are turned into rows on the calling thread while a single background thread
+    encodes and writes them, so processing and writing overlap.
     
     Args:
-        data_list (list): The processed business data
+        businesses (iterable): The processed business data
         file_path (str): Path to save the CSV file
         
     Returns:
         bool: True if the data was successfully saved, False otherwise
     """
     try:
-        if not data_list:
-            print("No data to save")
-            return False
-            
         # Create directory if it doesn't exist
         os.makedirs(os.path.dirname(file_path), exist_ok=True)
         
-        # Define column order: specified columns first, then all others
-        priority_fields = ['business_id', 'name', 'phone_numbers', 'emails', 'social_media']
-        
-        # Columns to exclude
-        exclude_columns = [
-            'google_id', 'place_id', 'google_mid', 'phone_number', 'place_link', 'cid', 'owner_id',
-            'latitude', 'longitude', 'working_hours', 'owner_link', 'booking_link', 
-            'reservations_link', 'photos_sample', 'reviews_link', 'reviews_per_rating', 
-            'photo_count', 'order_link', 'price_level', 'street_address',
-            'emails_and_contacts'  # Exclude this as we'll extract its contents
-        ]
-        
-        # Get remaining fields (excluding the ones to exclude and already prioritized)
-        remaining_fields = [field for field in data_list[0].keys() 
-                           if field not in exclude_columns and field not in priority_fields]
-        
-        # Final field order
-        fieldnames = priority_fields + remaining_fields
+        log.info("Saving data to %s...", file_path)
+        # The bounded queue keeps memory flat if the writer falls behind
+        row_queue = queue.Queue(maxsize=CSV_QUEUE_SIZE)
+        # Write to a temporary file first so a failed run leaves the previous CSV intact
+        tmp_file_path = f"{file_path}.tmp"
+        try:
+            # A large buffer batches many rows into each write to disk
+            with open(tmp_file_path, mode='w', newline='', encoding='utf-8', buffering=CSV_BUFFER_SIZE) as file:
+                with ThreadPoolExecutor(max_workers=1) as executor:
+                    writer_future = executor.submit(write_csv_rows, row_queue, file)
+                    try:
+                        for item in businesses:
+                            # Emit the output columns in order, so excluded ones never need filtering,
+                            # with every value already converted to a string
+                            row_queue.put([str(value) if value is not None else ''
+                                           for value in map(item.get, CSV_FIELDS)])
+                    finally:
+                        row_queue.put(None)
+                    record_count = writer_future.result()
+            if record_count == 0:
+                log.warning("No data to save")
+                return False
+            os.replace(tmp_file_path, file_path)
+        finally:
+            if os.path.exists(tmp_file_path):
+                os.remove(tmp_file_path)
         
-        print(f"Saving data to {file_path}...")
-        with open(file_path, mode='w', newline='', encoding='utf-8') as file:
-            writer = csv.DictWriter(file, fieldnames=fieldnames)
-            writer.writeheader()
-            for item in data_list:
-                # Create a new dictionary without the excluded columns
-                filtered_item = {key: value for key, value in item.items() if key not in exclude_columns}
-                writer.writerow(filtered_item)
-                
-        print(f"Successfully saved {len(data_list)} records to {file_path}")
+        log.info("Successfully saved %d records to %s", record_count, file_path)
         return True
-    except Exception as e:
-        print(f"Error saving data to CSV: {e}")
+    except Exception:
+        log.exception("Error saving data to CSV")
         return False
 
 def main():
@@ -170,30 +415,31 @@ def main():
     Returns:
         bool: True if the process completed successfully, False otherwise
     """
-    print("Starting leads generation process...")
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    log.info("Starting leads generation process...")
     
-    # Define the output file path from environment variable
-    file_path = Path(os.environ.get('LEADS_CSV_PATH', "venv/data/leads.csv"))
+    # Define the output file path from the cached configuration
+    file_path = get_config().csv_path
     
     # Fetch business data from API
     data = fetch_business_data()
     if not data:
-        print("Failed to fetch business data. Aborting.")
+        log.error("Failed to fetch business data. Aborting.")
         return False
     
-    # Process the business data
-    data_list = process_business_data(data)
+    data_list = data.get("data", [])
     if not data_list:
-        print("Failed to process business data. Aborting.")
+        log.error("No business data found in API response. Aborting.")
         return False
     
-    # Save the processed data to CSV
-    success = save_to_csv(data_list, file_path)
+    # Process each business record as it is written, in a single pass over the data
+    log.info("Processing and saving %d business records...", len(data_list))
+    success = save_to_csv(iter_processed(data), file_path)
     if not success:
-        print("Failed to save business data to CSV. Aborting.")
+        log.error("Failed to save business data to CSV. Aborting.")
         return False
     
-    print("Leads generation process completed successfully!")
+    log.info("Leads generation process completed successfully!")
     return True
 
 if __name__ == "__main__":